@@ -3,141 +3,56 @@
 # (Amazon Bedrock + ChatGPT + LangChain + Streamlit)
 # ================================================================
 
+import asyncio
 import streamlit as st
-import boto3
+import httpx
+import logging
 import os
-from pathlib import Path
-from langchain_aws.chat_models import ChatBedrock
-from langchain_aws.embeddings import BedrockEmbeddings
-from langchain_chroma import Chroma
-from langchain.document_loaders import TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_core.messages import HumanMessage
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.chat_history import InMemoryChatMessageHistory
-from openai import OpenAI
-from dotenv import load_dotenv
+from botocore.exceptions import BotoCoreError, ClientError
+from openai import AsyncOpenAI
+from core import (
+    SECURITY_CONTEXT, ask_bedrock, get_browser_session_id, get_context,
+    iter_async, run_async,
+)
 
 # ---------------------------------------------------------------
 # 1️⃣ Environment Setup
 # ---------------------------------------------------------------
-load_dotenv()  # loads .env if exists
+log = logging.getLogger(__name__)
 
 # Required: OPENAI_API_KEY=sk-xxxxx
 openai_key = os.getenv("OPENAI_API_KEY")
-if not openai_key:
-    st.warning("⚠️ Missing OpenAI API key. Please add it to your .env file.")
-client = OpenAI(api_key=openai_key)
-
-# ---------------------------------------------------------------
-# 2️⃣ AWS & Model Setup
-# ---------------------------------------------------------------
-boto3_session = boto3.session.Session()
-region = boto3_session.region_name or "us-east-1"
-
-model_id = "amazon.titan-text-lite-v1"
-embedding_model = "amazon.titan-embed-text-v1"
-temperature = 0.2
-
-# Initialize Bedrock model
-llm_chat = ChatBedrock(
-    model_id=model_id,
-    model_kwargs={"temperature": temperature},
-    region_name=region
-)
 
-embedding = BedrockEmbeddings(
-    model_id=embedding_model,
-    region_name=region
-)
-
-# ---------------------------------------------------------------
-# 3️⃣ Chroma Vector Store (persistent knowledge)
-# ---------------------------------------------------------------
-DATA_DIR = Path("data")
-DATA_DIR.mkdir(exist_ok=True)
-INDEX_DIR = "security_index"
-
-nist_file = DATA_DIR / "nist_800-53_summary.txt"
-cis_file = DATA_DIR / "cis_rhel_benchmark.txt"
-
-# Default context if missing
-if not nist_file.exists():
-    nist_file.write_text("""
-NIST 800-53 AC-2: Manage IAM users/roles and enforce least privilege using AWS IAM policies.
-Use AWS Config rules for periodic review of permissions and access keys.
-CM-2: Maintain baseline configurations using Systems Manager and AWS Config Conformance Packs.
-""")
-
-if not cis_file.exists():
-    cis_file.write_text("""
-CIS Linux hardening: Disable root SSH, enforce password complexity, enable auditd,
-restrict firewall rules, and regularly patch instances with AWS Systems Manager.
-""")
-
-def build_or_load_index():
-    if Path(INDEX_DIR).exists():
-        print("✅ Loading existing Chroma index...")
-        return Chroma(persist_directory=INDEX_DIR, embedding_function=embedding)
-    print("⚙️ Building Chroma index from ./data ...")
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    docs = []
-    for file in DATA_DIR.glob("*.txt"):
-        docs += splitter.split_documents(TextLoader(str(file)).load())
-    vectorstore = Chroma.from_documents(docs, embedding, persist_directory=INDEX_DIR)
-    vectorstore.persist()
-    print("💾 Index saved to", INDEX_DIR)
-    return vectorstore
-
-vectorstore = build_or_load_index()
-retriever = vectorstore.as_retriever(search_kwargs={"k": 4})
-
-# ---------------------------------------------------------------
-# 4️⃣ Memory
-# ---------------------------------------------------------------
-store = {}
-def get_session_history(session_id):
-    if session_id not in store:
-        store[session_id] = InMemoryChatMessageHistory()
-    return store[session_id]
-
-with_message_history = RunnableWithMessageHistory(llm_chat, get_session_history)
-
-# ---------------------------------------------------------------
-# 5️⃣ Context for Security & Compliance
-# ---------------------------------------------------------------
-SECURITY_CONTEXT = """
-You are an AWS Security & Compliance expert.
-Explain cybersecurity and compliance frameworks (FISMA, NIST 800-53, CIS, FedRAMP)
-and how to implement them using AWS services such as IAM, Config, GuardDuty,
-SecurityHub, CloudTrail, and CloudWatch.
-Be concise and provide AWS service mapping examples when possible.
-"""
+# Seconds to wait for Bedrock's first streamed chunk before switching to ChatGPT
+FIRST_TOKEN_TIMEOUT = float(os.getenv("BEDROCK_FIRST_TOKEN_TIMEOUT", "3.0"))
+
+# Errors that trigger the fallback: first-token deadline, connect/read
+# timeouts (BotoCoreError), throttling/model timeouts (ClientError), and
+# ValueError, which ChatBedrock wraps Bedrock service errors in
+BEDROCK_ERRORS = (asyncio.TimeoutError, BotoCoreError, ClientError, ValueError)
+
+# RACE_MODELS=1 asks Bedrock and ChatGPT in parallel and keeps the first
+# answer; lowers latency but pays for both models on every question
+RACE_MODELS = os.getenv("RACE_MODELS") == "1"
+
+# Only ever used on the shared event loop (core.get_event_loop), so its
+# keep-alive pool stays valid and cancelling a task aborts the request
+@st.cache_resource
+def get_openai_client():
+    return AsyncOpenAI(
+        api_key=openai_key,
+        http_client=httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=2.0),
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+        ),
+    )
 
 # ---------------------------------------------------------------
-# 6️⃣ Chat Functions
+# 2️⃣ Chat Functions
 # ---------------------------------------------------------------
-def ask_bedrock(question: str, session_id="sec-bot-ui"):
-    """Try answering using Amazon Bedrock Titan."""
-    ctx_docs = retriever.invoke(question)
-    ctx = "\n\n".join([d.page_content for d in ctx_docs]) if ctx_docs else ""
-    prompt = f"""{SECURITY_CONTEXT}
-
-Context:
-{ctx}
-
-Question: {question}
-"""
-    response = with_message_history.invoke(
-        [HumanMessage(content=prompt)],
-        config={"configurable": {"session_id": session_id}},
-    )
-    return response.content
-
-def ask_chatgpt(question: str):
+async def ask_chatgpt(question: str):
     """Fallback to OpenAI GPT when Bedrock can't respond."""
-    prompt = f"{SECURITY_CONTEXT}\n\nQuestion: {question}"
-    response = client.chat.completions.create(
+    response = await get_openai_client().chat.completions.create(
         model="gpt-4o-mini",
         messages=[{"role": "system", "content": SECURITY_CONTEXT},
                   {"role": "user", "content": question}],
@@ -146,34 +61,80 @@ def ask_chatgpt(question: str):
     )
     return response.choices[0].message.content.strip()
 
-def ask_secure_bot(question: str, session_id="sec-bot-ui"):
-    """Try Bedrock first, then fallback to ChatGPT."""
+async def ask_secure_bot(question: str, session_id: str):
+    """Yield the answer as it grows: Bedrock first, then fallback to ChatGPT.
+
+    Falls back on Bedrock errors or when no chunk arrives within
+    FIRST_TOKEN_TIMEOUT, without waiting for a full generation.
+    """
     try:
-        answer = ask_bedrock(question, session_id)
-        if "unable to respond" in answer.lower() or not answer.strip():
-            raise Exception("Bedrock failed, switching to ChatGPT")
-        return f"🧠 **Bedrock:**\n\n{answer}"
-    except Exception as e:
-        print(f"[Fallback] {e}")
+        # Retrieval runs before the deadline so only the model's latency counts
+        ctx = await asyncio.to_thread(get_context, question)
+        stream = ask_bedrock(question, session_id, ctx=ctx)
+        try:
+            answer = await asyncio.wait_for(stream.__anext__(), timeout=FIRST_TOKEN_TIMEOUT)
+        except StopAsyncIteration:
+            raise ValueError("Bedrock returned an empty response")
+        yield f"🧠 **Bedrock:**\n\n{answer}"
+        async for text in stream:
+            answer += text
+            yield f"🧠 **Bedrock:**\n\n{answer}"
+        if not answer.strip():
+            raise ValueError("Bedrock returned an empty response")
+    except BEDROCK_ERRORS as e:
+        log.warning("Falling back to ChatGPT: %s", e)
         try:
-            gpt_answer = ask_chatgpt(question)
-            return f"🤖 **ChatGPT Fallback:**\n\n{gpt_answer}"
+            gpt_answer = await ask_chatgpt(question)
+            yield f"🤖 **ChatGPT Fallback:**\n\n{gpt_answer}"
         except Exception as e2:
-            return f"❌ Both models failed: {e2}"
+            yield f"❌ Both models failed: {e2}"
+
+async def collect_bedrock(question: str, session_id: str):
+    ctx = await asyncio.to_thread(get_context, question)
+    return "".join([text async for text in ask_bedrock(question, session_id, ctx=ctx)])
+
+async def race_models(question: str, session_id: str):
+    """Ask Bedrock and ChatGPT at once and return whichever answers first."""
+    # ChatGPT is scheduled first so its request is in flight during retrieval
+    labels = {
+        asyncio.create_task(ask_chatgpt(question)): "🤖 **ChatGPT:**",
+        asyncio.create_task(collect_bedrock(question, session_id)): "🧠 **Bedrock:**",
+    }
+    pending = set(labels)
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result().strip():
+                    return f"{labels[task]}\n\n{task.result()}"
+                error = task.exception() or ValueError("empty response")
+    finally:
+        for task in pending:
+            task.cancel()
+    return f"❌ Both models failed: {error}"
 
 # ---------------------------------------------------------------
-# 7️⃣ Streamlit UI
+# 3️⃣ Streamlit UI
 # ---------------------------------------------------------------
 st.set_page_config(page_title="AWS Security & Compliance Chatbot", page_icon="🛡️")
 st.title("🛡️ AWS Security & Compliance Chatbot")
 st.caption("Powered by Amazon Bedrock + OpenAI + LangChain")
 
+if not openai_key:
+    st.warning("⚠️ Missing OpenAI API key. Please add it to your .env file.")
+
+session_id = get_browser_session_id()
 user_question = st.text_input("Ask a compliance or security question:")
 
 if st.button("Ask") and user_question:
     with st.spinner("Analyzing with Bedrock..."):
         try:
-            answer = ask_secure_bot(user_question)
-            st.markdown(answer)
+            placeholder = st.empty()
+            if RACE_MODELS:
+                placeholder.markdown(run_async(race_models(user_question, session_id)))
+            else:
+                for answer in iter_async(ask_secure_bot(user_question, session_id)):
+                    placeholder.markdown(answer)
         except Exception as e:
             st.error(f"⚠️ Error: {e}")
@@ -0,0 +1,351 @@
+# ================================================================
+# 🛡️ AWS Security & Compliance Chatbot — shared core
+# Bedrock clients, FAISS index, session memory and prompt used by
+# both Streamlit UIs (app.py and app+gpt.py).
+# ================================================================
+
+import asyncio
+import streamlit as st
+import boto3
+import os
+import threading
+import faiss
+import hashlib
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
+from pathlib import Path
+from uuid import uuid4
+from botocore.config import Config
+from cachetools import LRUCache
+from diskcache import Cache
+from langchain_aws.chat_models import ChatBedrock, ChatBedrockConverse
+from langchain_aws.embeddings import BedrockEmbeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain.document_loaders import TextLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables.history import RunnableWithMessageHistory
+from langchain_core.chat_history import InMemoryChatMessageHistory
+from dotenv import load_dotenv
+
+load_dotenv()  # loads .env if exists, before any settings are read
+
+# LOGLEVEL=INFO shows index build/load messages; quiet by default
+logging.basicConfig(level=os.getenv("LOGLEVEL", "WARNING"))
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------
+# 1️⃣ AWS & Model Setup
+# ---------------------------------------------------------------
+boto3_session = boto3.session.Session()
+region = boto3_session.region_name or "us-east-1"
+
+# BEDROCK_LATENCY_OPTIMIZED=1 switches to a model/region pair that supports
+# Bedrock latency-optimized inference; unset keeps standard Titan inference.
+latency_optimized = os.getenv("BEDROCK_LATENCY_OPTIMIZED") == "1"
+if latency_optimized:
+    model_id = os.getenv("BEDROCK_MODEL_ID", "us.anthropic.claude-3-5-haiku-20241022-v1:0")
+else:
+    model_id = os.getenv("BEDROCK_MODEL_ID", "amazon.titan-text-lite-v1")
+embedding_model = "amazon.titan-embed-text-v1"
+temperature = 0.2
+
+# Clients are created once per server process and reused across reruns
+@st.cache_resource
+def get_bedrock_client():
+    # Shared keep-alive connection pool, so calls skip the TLS handshake
+    cfg = Config(
+        region_name=region,
+        retries={"max_attempts": 3, "mode": "adaptive"},
+        tcp_keepalive=True,
+        max_pool_connections=50,
+        connect_timeout=2,
+        read_timeout=30,
+    )
+    return boto3_session.client("bedrock-runtime", config=cfg)
+
+@st.cache_resource
+def get_llm():
+    if latency_optimized:
+        return ChatBedrockConverse(
+            model_id=model_id,
+            temperature=temperature,
+            region_name=region,
+            client=get_bedrock_client(),
+            performance_config={"latency": "optimized"}
+        )
+    return ChatBedrock(
+        model_id=model_id,
+        model_kwargs={"temperature": temperature},
+        region_name=region,
+        client=get_bedrock_client()
+    )
+
+EMBED_CACHE_DIR = ".embed_cache"
+
+@st.cache_resource
+def get_embed_cache():
+    # On-disk, so query vectors survive Streamlit restarts and are shared
+    # across sessions and processes
+    return Cache(EMBED_CACHE_DIR)
+
+class CachedBedrockEmbeddings(BedrockEmbeddings):
+    """Bedrock embeddings that reuse stored vectors for repeated query texts."""
+
+    def embed_query(self, text):
+        # Keyed on the normalized text so the hit rate doesn't depend on the caller
+        text = normalize_question(text)
+        key = hashlib.sha256(f"{self.model_id}\n{text}".encode()).hexdigest()
+        cache = get_embed_cache()
+        vector = cache.get(key)
+        if vector is None:
+            vector = super().embed_query(text)
+            cache[key] = vector
+        return vector
+
+@st.cache_resource
+def get_embedding():
+    return CachedBedrockEmbeddings(
+        model_id=embedding_model,
+        region_name=region,
+        client=get_bedrock_client()
+    )
+
+# ---------------------------------------------------------------
+# 2️⃣ FAISS Vector Store (persistent knowledge)
+# ---------------------------------------------------------------
+DATA_DIR = Path("data")
+INDEX_DIR = "security_index"
+LOADER_WORKERS = 8
+
+nist_file = DATA_DIR / "nist_800-53_summary.txt"
+cis_file = DATA_DIR / "cis_rhel_benchmark.txt"
+
+def seed_default_data():
+    """Default context if missing."""
+    DATA_DIR.mkdir(exist_ok=True)
+    if not nist_file.exists():
+        nist_file.write_text("""
+NIST 800-53 AC-2: Manage IAM users/roles and enforce least privilege using AWS IAM policies.
+Use AWS Config rules for periodic review of permissions and access keys.
+CM-2: Maintain baseline configurations using Systems Manager and AWS Config Conformance Packs.
+""")
+
+    if not cis_file.exists():
+        cis_file.write_text("""
+CIS Linux hardening: Disable root SSH, enforce password complexity, enable auditd,
+restrict firewall rules, and regularly patch instances with AWS Systems Manager.
+""")
+
+@st.cache_resource
+def get_splitter():
+    # Token-sized chunks (tiktoken encoder loaded once per process)
+    return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name="cl100k_base",
+        chunk_size=400,
+        chunk_overlap=40,
+    )
+
+@st.cache_resource
+def build_or_load_index():
+    embedding = get_embedding()
+    if (Path(INDEX_DIR) / "index.faiss").exists():
+        log.info("Loading existing FAISS index from %s", INDEX_DIR)
+        # index.pkl is written by save_local below, never taken from outside
+        return FAISS.load_local(
+            INDEX_DIR,
+            embedding,
+            allow_dangerous_deserialization=True,
+            normalize_L2=True,
+        )
+    log.info("Building FAISS index from %s", DATA_DIR)
+    seed_default_data()
+    splitter = get_splitter()
+    files = [f for f in DATA_DIR.iterdir()
+             if f.suffix == ".txt" and f.is_file() and f.stat().st_size > 0]
+    # Read and split files in parallel; order of results follows `files`
+    with ThreadPoolExecutor(max_workers=LOADER_WORKERS) as ex:
+        chunks = list(ex.map(
+            lambda f: splitter.split_documents(TextLoader(str(f)).load()), files
+        ))
+    docs = [d for c in chunks for d in c]
+    if not docs:
+        raise ValueError(f"No non-empty .txt documents found in {DATA_DIR} to index")
+    texts = [d.page_content for d in docs]
+    ids = [str(i) for i in range(len(texts))]
+    # One embed_documents call up front, then a single add into the index
+    embeddings = np.asarray(embedding.embed_documents(texts), dtype=np.float32)
+    # Unit vectors: L2 ranking matches cosine, and queries are normalized too
+    faiss.normalize_L2(embeddings)
+    # int8 scalar quantization stores each vector in 1/4 of the FP32 size
+    index = faiss.IndexScalarQuantizer(
+        embeddings.shape[1], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2
+    )
+    index.train(embeddings)
+    index.add(embeddings)
+    vectorstore = FAISS(
+        embedding_function=embedding,
+        index=index,
+        docstore=InMemoryDocstore(dict(zip(ids, docs))),
+        index_to_docstore_id=dict(enumerate(ids)),
+        distance_strategy=DistanceStrategy.EUCLIDEAN_DISTANCE,
+        normalize_L2=True,
+    )
+    vectorstore.save_local(INDEX_DIR)
+    log.info("Index saved to %s", INDEX_DIR)
+    return vectorstore
+
+@st.cache_resource
+def get_retriever():
+    return build_or_load_index().as_retriever(
+        search_type="similarity",
+        search_kwargs={"k": 4},
+    )
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
+def retrieve_context(question: str) -> str:
+    """Embed + search once per normalized question; reruns hit the cache."""
+    ctx_docs = get_retriever().invoke(question)
+    return "\n\n".join(map(attrgetter("page_content"), ctx_docs))
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split())
+
+# ---------------------------------------------------------------
+# 3️⃣ Memory
+# ---------------------------------------------------------------
+MAX_SESSIONS = 1024  # browser tabs (see get_browser_session_id)
+MAX_HISTORY_MESSAGES = 40  # last 20 question/answer turns
+
+class BoundedChatMessageHistory(InMemoryChatMessageHistory):
+    """In-memory history that only keeps the most recent messages."""
+
+    def add_message(self, message):
+        super().add_message(message)
+        self.messages = self.messages[-MAX_HISTORY_MESSAGES:]
+
+@st.cache_resource
+def get_history_store():
+    # One history per browser session id; the least recently used tabs are
+    # evicted once MAX_SESSIONS is reached
+    return LRUCache(maxsize=MAX_SESSIONS)
+
+def get_browser_session_id():
+    """Chat session id for the current browser tab, created on its first run."""
+    return st.session_state.setdefault("session_id", str(uuid4()))
+
+def get_session_history(session_id):
+    store = get_history_store()
+    if session_id not in store:
+        store[session_id] = BoundedChatMessageHistory()
+    return store[session_id]
+
+@st.cache_resource
+def get_chain():
+    # Only the question and the reply are recorded; system prompt and
+    # retrieved context are re-supplied fresh each turn by PROMPT_TPL
+    return RunnableWithMessageHistory(
+        PROMPT_TPL | get_llm(),
+        get_session_history,
+        input_messages_key="question",
+        history_messages_key="history",
+    )
+
+# ---------------------------------------------------------------
+# 4️⃣ Context for Security & Compliance
+# ---------------------------------------------------------------
+SECURITY_CONTEXT = """
+You are an AWS Security & Compliance expert.
+Explain cybersecurity and compliance frameworks (FISMA, NIST 800-53, CIS, FedRAMP)
+and how to implement them using AWS services such as IAM, Config, GuardDuty,
+SecurityHub, CloudTrail, and CloudWatch.
+Be concise and provide AWS service mapping examples when possible.
+"""
+
+# Prompt caching is only sent on the Converse path and for Anthropic models;
+# other models (e.g. Llama under latency-optimized inference) reject cache
+# points. A cache point after the fixed system prompt lets Bedrock reuse the
+# processed prefix across turns; the per-question context, history and
+# question stay after the cache boundary. Note: Bedrock only caches prefixes
+# above the model's minimum (1024+ tokens for Claude), and SECURITY_CONTEXT is
+# ~80 tokens, so this has no effect until the system prompt grows past that.
+prompt_caching = latency_optimized and "anthropic." in model_id
+if prompt_caching:
+    SYSTEM_MESSAGE = SystemMessage(content=[
+        {"type": "text", "text": SECURITY_CONTEXT},
+        ChatBedrockConverse.create_cache_point(),
+    ])
+else:
+    SYSTEM_MESSAGE = SystemMessage(content=SECURITY_CONTEXT)
+
+# Built once at import; ctx, history and question are filled in per call
+PROMPT_TPL = ChatPromptTemplate.from_messages([
+    SYSTEM_MESSAGE,
+    ("system", "Context:\n{ctx}"),
+    MessagesPlaceholder("history"),
+    ("human", "{question}"),
+])
+
+# ---------------------------------------------------------------
+# 5️⃣ Bedrock Chat
+# ---------------------------------------------------------------
+def chunk_text(chunk) -> str:
+    """Text of a streamed chunk (Converse streams a list of content blocks)."""
+    if isinstance(chunk.content, str):
+        return chunk.content
+    return "".join(b.get("text", "") for b in chunk.content if isinstance(b, dict))
+
+def get_context(question: str) -> str:
+    return retrieve_context(normalize_question(question))
+
+async def ask_bedrock(question: str, session_id: str, ctx=None):
+    """Stream an answer from Amazon Bedrock, with retrieved context and history."""
+    if ctx is None:
+        # Blocking embed + search, kept off the shared event loop
+        ctx = await asyncio.to_thread(get_context, question)
+    async for chunk in get_chain().astream(
+        {"ctx": ctx, "question": question},
+        config={"configurable": {"session_id": session_id}},
+    ):
+        yield chunk_text(chunk)
+
+# ---------------------------------------------------------------
+# 6️⃣ Shared Event Loop
+# ---------------------------------------------------------------
+# asyncio.run() per question would join the default executor on exit, so a
+# stalled blocking Bedrock call would hold the page until it finished. One
+# long-lived loop lets abandoned calls finish in the background instead.
+@st.cache_resource
+def get_event_loop():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="chat-event-loop", daemon=True).start()
+    return loop
+
+def run_async(coro):
+    """Run a coroutine on the shared loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+_DONE = object()
+
+async def _next_or_done(agen):
+    try:
+        return await agen.__anext__()
+    except StopAsyncIteration:
+        return _DONE
+
+def iter_async(agen):
+    """Iterate an async generator on the shared loop from the script thread.
+
+    Items come back to the caller so Streamlit elements are only touched
+    from the script thread.
+    """
+    while True:
+        item = run_async(_next_or_done(agen))
+        if item is _DONE:
+            return
+        yield item